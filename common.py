@@ -0,0 +1,475 @@
+"""
+Shared helpers for the prompt submitters.
+"""
+import asyncio
+import fnmatch
+import functools
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+import diskcache
+import httpx
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path.home() / ".cache" / "genai_submitter"
+DEFAULT_RPM = 500
+SEMANTIC_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+RETRY_ATTEMPTS = 6
+RETRY_INITIAL_WAIT = 1
+RETRY_MAX_WAIT = 60
+# Consecutive calls that failed after all RETRY_ATTEMPTS attempts
+CIRCUIT_FAIL_MAX = 5
+CIRCUIT_RESET_TIMEOUT = 30
+BATCH_POLL_INITIAL = 10
+BATCH_POLL_MAX = 300
+HTTP_RETRIES = 3
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+HTTP_POOL_LIMITS = httpx.Limits(max_keepalive_connections=64, max_connections=128)
+
+_http_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide async HTTP client, creating it on first use.
+
+    All submitter instances share this client, so TCP/TLS connections are kept
+    alive between requests instead of being set up for every prompt, and with
+    HTTP/2 concurrent requests are multiplexed over the same connection.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        try:
+            transport = httpx.AsyncHTTPTransport(retries=HTTP_RETRIES, http2=True, limits=HTTP_POOL_LIMITS)
+        except ImportError:
+            logger.warning("HTTP/2 support not installed (pip install 'httpx[http2]'), falling back to HTTP/1.1")
+            transport = httpx.AsyncHTTPTransport(retries=HTTP_RETRIES, limits=HTTP_POOL_LIMITS)
+        _http_client = httpx.AsyncClient(transport=transport, timeout=HTTP_TIMEOUT)
+    return _http_client
+
+class RateLimiter:
+    """Token-bucket limiter pacing requests per minute (RPM) and tokens per minute (TPM).
+
+    Both buckets start full and are refilled by a background task every
+    refill_interval seconds. A limit of None disables that bucket. One limiter
+    can be shared by several submitters so they draw from the same budget.
+    """
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = None, refill_interval: float = 0.1):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.refill_interval = refill_interval
+        # Room for at least one request, or an rpm below 1 could never reach a whole request
+        self._request_capacity = max(float(rpm or 0), 1.0)
+        self._requests = self._request_capacity
+        self._tokens = float(tpm or 0)
+        self._loop = None
+        self._condition = None
+        self._refill_task = None
+        self._last_refill = 0.0
+
+    def _ensure_started(self):
+        """Bind the condition and refill task to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._refill_task.done():
+            self._loop = loop
+            self._condition = asyncio.Condition()
+            self._last_refill = loop.time()
+            self._refill_task = loop.create_task(self._refill())
+
+    async def _refill(self):
+        """Top up both buckets in proportion to the time elapsed since the last refill."""
+        while True:
+            await asyncio.sleep(self.refill_interval)
+            async with self._condition:
+                now = self._loop.time()
+                elapsed = now - self._last_refill
+                self._last_refill = now
+                if self.rpm:
+                    self._requests = min(self._request_capacity, self._requests + elapsed * self.rpm / 60)
+                if self.tpm:
+                    self._tokens = min(float(self.tpm), self._tokens + elapsed * self.tpm / 60)
+                self._condition.notify_all()
+
+    def _has_capacity(self, tokens: int) -> bool:
+        if self.rpm and self._requests < 1:
+            return False
+        if self.tpm and self._tokens < tokens:
+            return False
+        return True
+
+    async def acquire(self, tokens: int = 0):
+        """Wait until one request and the given number of tokens are available, then consume them."""
+        if not self.rpm and not self.tpm:
+            return
+
+        self._ensure_started()
+        # A single prompt larger than the whole TPM budget would never fit, so cap it at the bucket size
+        if self.tpm:
+            tokens = min(tokens, self.tpm)
+
+        async with self._condition:
+            if not self._has_capacity(tokens):
+                logger.debug(f"Rate limit reached, waiting for capacity ({tokens} tokens requested)")
+            await self._condition.wait_for(lambda: self._has_capacity(tokens))
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+
+class ResponseCache:
+    """On-disk cache of responses keyed by sha256(model + prompt).
+
+    Backed by diskcache, so it is safe to share between concurrent processes.
+    A ttl of None keeps entries until they are evicted.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, ttl: float = None):
+        self.ttl = ttl
+        self._cache = diskcache.Cache(str(cache_dir))
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str) -> str:
+        return self._cache.get(self.key(model, prompt))
+
+    def set(self, model: str, prompt: str, response: str):
+        self._cache.set(self.key(model, prompt), response, expire=self.ttl)
+
+class SemanticCache:
+    """Cache returning the stored response of the most similar earlier prompt.
+
+    Prompts are embedded with a small local sentence-transformers model and
+    looked up in a faiss inner-product index of normalized embeddings (i.e.
+    cosine similarity), one index per model. A cached response is returned
+    when the nearest prompt's similarity exceeds the threshold. Indexes and
+    responses are persisted under cache_dir/semantic.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 model_name: str = SEMANTIC_MODEL):
+        try:
+            import faiss
+            import numpy as np
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "The semantic cache requires sentence-transformers and faiss "
+                "(pip install sentence-transformers faiss-cpu)"
+            ) from e
+
+        self.threshold = threshold
+        self._faiss = faiss
+        self._np = np
+        self._dir = Path(cache_dir) / "semantic"
+        self._dir.mkdir(parents=True, exist_ok=True)
+        logger.info(f"Loading embedding model for semantic cache: {model_name}")
+        self._encoder = SentenceTransformer(model_name)
+        self._responses = diskcache.Cache(str(self._dir / "responses"))
+        self._indexes = {}
+
+    def _index_path(self, model: str) -> Path:
+        return self._dir / f"{hashlib.sha256(model.encode('utf-8')).hexdigest()[:16]}.faiss"
+
+    def _get_index(self, model: str):
+        """Load the index for a model from disk, or create an empty one."""
+        if model not in self._indexes:
+            path = self._index_path(model)
+            if path.exists():
+                self._indexes[model] = self._faiss.read_index(str(path))
+            else:
+                dimension = self._encoder.get_sentence_embedding_dimension()
+                self._indexes[model] = self._faiss.IndexIDMap(self._faiss.IndexFlatIP(dimension))
+        return self._indexes[model]
+
+    @staticmethod
+    def _entry_id(model: str, prompt: str) -> int:
+        # Derived from the prompt rather than the index position, so entries stay
+        # consistent with their responses even if another process rewrites the index
+        return int(ResponseCache.key(model, prompt)[:15], 16)
+
+    @functools.lru_cache(maxsize=256)
+    def _embed(self, prompt: str):
+        return self._encoder.encode([prompt], normalize_embeddings=True).astype("float32")
+
+    async def aget(self, model: str, prompt: str) -> str:
+        """Return the response of the most similar cached prompt, or None if none is similar enough."""
+        index = self._get_index(model)
+        if index.ntotal == 0:
+            return None
+
+        # Embedding is CPU-bound, so keep it off the event loop
+        embedding = await asyncio.to_thread(self._embed, prompt)
+        scores, ids = index.search(embedding, 1)
+        similarity, entry_id = float(scores[0][0]), int(ids[0][0])
+        if entry_id < 0 or similarity < self.threshold:
+            return None
+
+        response = self._responses.get(entry_id)
+        if response is not None:
+            logger.info(f"Semantic cache hit (similarity: {similarity:.3f}, model: {model}), skipping API call")
+        return response
+
+    async def aset(self, model: str, prompt: str, response: str):
+        """Add the prompt embedding to the model's index and store its response."""
+        embedding = await asyncio.to_thread(self._embed, prompt)
+        entry_id = self._entry_id(model, prompt)
+        self._responses.set(entry_id, response)
+        index = self._get_index(model)
+        index.add_with_ids(embedding, self._np.array([entry_id], dtype="int64"))
+        self._faiss.write_index(index, str(self._index_path(model)))
+
+class CircuitBreakerError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open."""
+
+class CircuitBreaker:
+    """Fail fast when an endpoint keeps failing.
+
+    After fail_max consecutive failures the circuit opens and calls are
+    rejected with CircuitBreakerError for reset_timeout seconds. After that,
+    calls are let through again; the first success closes the circuit, while
+    another failure opens it for a new period.
+    """
+
+    def __init__(self, name: str, fail_max: int = CIRCUIT_FAIL_MAX, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._fail_count = 0
+        self._opened_at = None
+
+    def before_call(self):
+        """Raise CircuitBreakerError if the circuit is open."""
+        if self._opened_at is None:
+            return
+        remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+        if remaining > 0:
+            raise CircuitBreakerError(
+                f"{self.name} circuit breaker is open after {self._fail_count} consecutive failures, "
+                f"not calling the API for another {remaining:.0f}s"
+            )
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info(f"{self.name} circuit breaker closed")
+        self._fail_count = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self._fail_count += 1
+        if self._fail_count >= self.fail_max:
+            if self._opened_at is None:
+                logger.warning(f"{self.name} circuit breaker opened after {self._fail_count} consecutive failures")
+            self._opened_at = time.monotonic()
+
+def scan_prompt_files(prompts_dir: Path, pattern: str = "*.txt") -> list[Path]:
+    """List the prompt files in prompts_dir matching pattern, sorted by name.
+
+    Uses os.scandir, whose entries carry the file type from the directory
+    listing, so only symlinked entries need a stat call.
+    """
+    try:
+        with os.scandir(prompts_dir) as entries:
+            names = [
+                entry.name for entry in entries
+                if entry.name.endswith(".txt") and entry.is_file()
+            ]
+    except FileNotFoundError:
+        return []
+    if pattern != "*.txt":
+        names = fnmatch.filter(names, pattern)
+    return [Path(prompts_dir) / name for name in sorted(names)]
+
+class PromptIndex:
+    """Prompt files in a directory by name, scanned once instead of on every lookup.
+
+    watch() keeps the index up to date as prompt files are added or removed,
+    which matters for long-running processes; it needs the optional watchdog package.
+    """
+
+    def __init__(self, prompts_dir: Path, pattern: str = "*.txt"):
+        self.prompts_dir = Path(prompts_dir)
+        self.pattern = pattern
+        self._lock = threading.Lock()
+        self._prompts = {path.stem: path for path in scan_prompt_files(self.prompts_dir, pattern)}
+        self._observer = None
+
+    def get(self, name: str) -> Path:
+        """Return the prompt file with this name, or None."""
+        with self._lock:
+            return self._prompts.get(name)
+
+    def paths(self) -> list[Path]:
+        """Return all prompt files, sorted by name."""
+        with self._lock:
+            return sorted(self._prompts.values())
+
+    def match(self, pattern: str) -> list[Path]:
+        """Return the prompt files whose file name matches a glob pattern, sorted by name."""
+        with self._lock:
+            return sorted(path for path in self._prompts.values() if fnmatch.fnmatch(path.name, pattern))
+
+    def _add(self, path: str):
+        path = Path(path)
+        if fnmatch.fnmatch(path.name, self.pattern) and path.is_file():
+            with self._lock:
+                self._prompts[path.stem] = path
+
+    def _remove(self, path: str):
+        path = Path(path)
+        with self._lock:
+            if self._prompts.get(path.stem) == path:
+                del self._prompts[path.stem]
+
+    def watch(self) -> bool:
+        """Update the index on file system events until stop() is called; return whether watching started."""
+        if self._observer:
+            return True
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.info("watchdog is not installed, new prompt files are only found after a restart")
+            return False
+        if not self.prompts_dir.is_dir():
+            logger.warning(f"Not watching {self.prompts_dir}, the directory does not exist")
+            return False
+
+        index = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    index._add(event.src_path)
+
+            def on_deleted(self, event):
+                if not event.is_directory:
+                    index._remove(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    index._remove(event.src_path)
+                    index._add(event.dest_path)
+
+        # Paths from events are built on the watched path, so they compare equal to the scanned ones
+        self._observer = Observer()
+        self._observer.schedule(Handler(), str(self.prompts_dir), recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+        return True
+
+    def stop(self):
+        """Stop watching the prompts directory."""
+        if self._observer:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+def _log_retry(retry_state):
+    logger.warning(
+        f"API call failed ({retry_state.outcome.exception()}), retrying in {retry_state.next_action.sleep:.1f}s "
+        f"(attempt {retry_state.attempt_number}/{RETRY_ATTEMPTS})"
+    )
+
+def retry_stream(stream):
+    """Decorate a submitter's _stream(prompt, model) with retries and the submitter's circuit breaker.
+
+    Errors accepted by self._is_retryable (rate limits, connection errors,
+    timeouts, 5xx) are retried with exponential backoff and jitter until the
+    first chunk arrives; other errors such as 400s fail immediately. Once
+    output has started, errors are not retried, since the chunks already
+    written would be repeated. The circuit breaker counts calls that still
+    fail with a transient error after all their attempts, not single attempts,
+    and is checked before every attempt, so an open circuit also ends calls
+    that are still retrying.
+    """
+    @functools.wraps(stream)
+    async def wrapper(self, prompt: str, model: str):
+        breaker = self.circuit_breaker
+        retrying = AsyncRetrying(
+            wait=wait_exponential_jitter(initial=RETRY_INITIAL_WAIT, max=RETRY_MAX_WAIT),
+            stop=stop_after_attempt(RETRY_ATTEMPTS),
+            retry=retry_if_exception(self._is_retryable),
+            before_sleep=_log_retry,
+            reraise=True
+        )
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    # Checked on every attempt, so calls already retrying stop once the circuit opens;
+                    # CircuitBreakerError is not retryable
+                    breaker.before_call()
+                    chunks = stream(self, prompt, model)
+                    try:
+                        first_chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        first_chunk = None
+        except Exception as e:
+            # One failure per call, once its own retries are used up, so a single prompt
+            # or a short burst of rate limits across prompts doesn't open the circuit
+            if self._is_retryable(e):
+                breaker.record_failure()
+            raise
+        breaker.record_success()
+
+        if first_chunk is not None:
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+    return wrapper
+
+def cached_stream(stream):
+    """Decorate a submitter's _stream(prompt, model) so repeated prompts are served from its caches.
+
+    The exact-match self.cache is checked first, then the optional
+    self.semantic_cache for near-duplicate prompts. A cache hit is yielded as a
+    single chunk. On a miss the chunks are passed through as they arrive and
+    the complete response is stored once the stream has finished.
+    """
+    @functools.wraps(stream)
+    async def wrapper(self, prompt: str, model: str):
+        cache = getattr(self, "cache", None)
+        semantic_cache = getattr(self, "semantic_cache", None)
+        if cache is None and semantic_cache is None:
+            async for chunk in stream(self, prompt, model):
+                yield chunk
+            return
+
+        response = cache.get(model, prompt) if cache else None
+        if response is not None:
+            logger.info(f"Cache hit for prompt ({len(prompt)} chars, model: {model}), skipping API call")
+        elif semantic_cache:
+            response = await semantic_cache.aget(model, prompt)
+        if response is not None:
+            yield response
+            return
+
+        chunks = []
+        async for chunk in stream(self, prompt, model):
+            chunks.append(chunk)
+            yield chunk
+        response = "".join(chunks)
+        if response:
+            if cache:
+                cache.set(model, prompt, response)
+            if semantic_cache:
+                await semantic_cache.aset(model, prompt, response)
+    return wrapper
+
+async def poll_until(fetch, is_done, initial: float = BATCH_POLL_INITIAL, maximum: float = BATCH_POLL_MAX):
+    """Call fetch() with exponential backoff until is_done(result) is true and return the last result."""
+    delay = initial
+    while True:
+        result = await fetch()
+        if is_done(result):
+            return result
+        logger.info(f"Batch job not finished yet, checking again in {delay:.0f}s")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, maximum)
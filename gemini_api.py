@@ -5,146 +5,134 @@ Submits custom prompts to Google Gemini API and saves the responses as markdown
 """
 import os
 import logging
-from pathlib import Path
+import functools
 from datetime import datetime
 from dotenv import load_dotenv
-import argparse
-import sys
 
-from google import genai
+import httpx
+
+from common import CircuitBreaker, get_http_client, poll_until
+from submitter_base import BaseSubmitter
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file in project folder
 load_dotenv()
 
-PROMPTS_DIR = "prompts"
-REPORTS_DIR = "reports"
+BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+@functools.cache
+def _get_genai():
+    """Import the Gemini SDK on first use, so --help and other providers don't pay for it."""
+    from google import genai
+    return genai
+
+class GeminiPromptSubmitter(BaseSubmitter):
+    name = "Gemini"
+    report_prefix = "gemini"
+    default_model = "gemini-2.5-flash-preview-04-17"
+    supports_batch = True
+    context_limit = 1_048_576
+    circuit_breaker = CircuitBreaker("Gemini")
 
-class GeminiPromptSubmitter:
-    def __init__(self, api_key: str = None):
-        """Initialize with Gemini API key."""
+    def __init__(self, api_key: str = None, **kwargs):
+        """Initialize with Gemini API key; other arguments are passed on to BaseSubmitter."""
+        super().__init__(**kwargs)
         self.api_key = api_key or os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             logger.error("GEMINI_API_KEY not found in environment variables or .env file.")
-            self.client = None
         else:
             try:
-                self.client = genai.Client(api_key=self.api_key)
+                # Reuse the shared HTTP/2 connection pool across all requests
+                self.client = _get_genai().Client(
+                    api_key=self.api_key,
+                    http_options={"httpx_async_client": get_http_client()}
+                )
                 logger.info("Gemini API client initialized successfully.")
             except Exception as e:
                 logger.error(f"Error initializing Gemini API client: {str(e)}")
                 self.client = None
 
-    def read_prompt(self, prompt_file: Path) -> str:
-        """Read the prompt from a text file."""
-        with open(prompt_file, 'r', encoding='utf-8') as f:
-            return f.read()
+    def _metadata_extras(self, model: str) -> dict:
+        return {"model": model}
 
-    def submit_prompt(self, prompt: str, model: str = "gemini-2.5-flash-preview-04-17") -> str:
-        """Submit the prompt to Gemini API and get the response."""
-        logger.info(f"Submitting prompt to Gemini. Prompt length: {len(prompt)}. Model: {model}")
-        
-        if self.client:
-            try:
-                response = self.client.models.generate_content(
-                    model=model, 
-                    contents=prompt
-                )
-                logger.info("Gemini submission complete. Response received.")
-                logger.debug(f"Gemini response preview: {response.text[:200]}")
-                return response.text
-            except Exception as e:
-                logger.error(f"Error calling Gemini API: {str(e)}")
-                return f"# Gemini API Error\n\n```\n{str(e)}\n```"
-        else:
-            logger.info("[SIMULATION] Would send prompt to Gemini here...")
-            # Simulate a response
-            return "# Gemini Response (Simulation)\n\nThis is a simulated response because the Gemini API client was not available."
+    async def _count_tokens(self, prompt: str, model: str) -> int:
+        """Count the prompt tokens with the Gemini API, which has no local tokenizer."""
+        if not self.client:
+            return await super()._count_tokens(prompt, model)
+        response = await self.client.aio.models.count_tokens(model=model, contents=prompt)
+        return response.total_tokens
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """Rate limits, connection errors, timeouts and server errors are worth retrying."""
+        from google.genai import errors
+        if isinstance(error, errors.APIError):
+            return error.code == 429 or error.code >= 500
+        return isinstance(error, httpx.TransportError)
 
-    def save_response(self, response: str, output_file: Path, prompt_name: str, submission_time: str):
-        """Save the Gemini response to a markdown file."""
+    async def _call_api(self, prompt: str, model: str):
+        """Call the Gemini API and yield the response text as it arrives, raising on failure."""
+        stream = await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=prompt
+        )
+        async for chunk in stream:
+            yield chunk.text or ""
+
+    async def submit_batch(self, prompts: dict[str, str], model: str = None) -> dict[str, str]:
+        """Submit prompts (keyed by prompt name) as one batch job and return the responses by prompt name."""
+        model = model or self.model
+        logger.info(f"Submitting {len(prompts)} prompts to Gemini as a batch job. Model: {model}")
+
+        if not self.client:
+            logger.info("[SIMULATION] Would send batch job to Gemini here...")
+            return {name: self._simulated_response() for name in prompts}
+
+        names = list(prompts)
         try:
-            # Add metadata to the top of the file
-            metadata = (
-                f"---\n"
-                f"prompt: {prompt_name}\n"
-                f"submitted_at: {submission_time}\n"
-                f"model: gemini-2.5-flash-preview-04-17\n"
-                f"---\n\n"
+            requests = [
+                {
+                    "contents": [{"parts": [{"text": prompt}], "role": "user"}],
+                    "metadata": {"key": name},
+                }
+                for name, prompt in prompts.items()
+            ]
+            job = await self.client.aio.batches.create(
+                model=model,
+                src=requests,
+                config={"display_name": f"prompt-submitter-{datetime.now().strftime('%Y%m%d_%H%M%S')}"}
+            )
+            logger.info(f"Gemini batch job created: {job.name}")
+
+            job = await poll_until(
+                lambda: self.client.aio.batches.get(name=job.name),
+                lambda j: j.state.name in BATCH_DONE_STATES
             )
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(metadata + response)
-                
-            logger.info(f"Response saved to {output_file}")
+            if job.state.name != "JOB_STATE_SUCCEEDED" or not job.dest or not job.dest.inlined_responses:
+                raise RuntimeError(f"Batch job {job.name} finished with state '{job.state.name}'")
+            logger.info("Gemini batch job complete.")
         except Exception as e:
-            logger.error(f"Error saving response: {str(e)}")
-
-def find_prompt_file(prompt_name: str = None) -> Path:
-    """Find a prompt file by name or list available prompts if none specified."""
-    prompts_dir = Path(PROMPTS_DIR)
-    
-    if not prompt_name:
-        # List available prompts
-        prompts = list(prompts_dir.glob("*.txt"))
-        if not prompts:
-            logger.error(f"No prompt files found in {prompts_dir}")
-            sys.exit(1)
-        
-        print("Available prompts:")
-        for i, prompt in enumerate(prompts, 1):
-            print(f"{i}. {prompt.stem}")
-        
-        # Ask user to select a prompt
-        selection = input("\nEnter prompt number to use: ")
-        try:
-            selected_idx = int(selection) - 1
-            if 0 <= selected_idx < len(prompts):
-                return prompts[selected_idx]
+            logger.error(f"Error running Gemini batch job: {str(e)}")
+            return {name: self._error_response(e) for name in prompts}
+
+        responses = {}
+        for i, result in enumerate(job.dest.inlined_responses):
+            # Inlined responses come back in request order; the metadata key is used when present
+            name = (result.metadata or {}).get("key") or names[i]
+            # text is None when the response has no text parts, e.g. when it was blocked
+            text = result.response.text if result.response and not result.error else None
+            if text:
+                responses[name] = text
             else:
-                logger.error("Invalid selection")
-                sys.exit(1)
-        except ValueError:
-            logger.error("Invalid input")
-            sys.exit(1)
-    else:
-        # Find prompt by name
-        prompt_file = prompts_dir / f"{prompt_name}.txt"
-        if not prompt_file.exists():
-            logger.error(f"Prompt file not found: {prompt_file}")
-            sys.exit(1)
-        return prompt_file
-
-def main():
-    parser = argparse.ArgumentParser(description="Gemini Prompt Submitter")
-    parser.add_argument('--prompt', type=str, help="Name of the prompt file to use (without .txt extension)")
-    parser.add_argument('--output', type=Path, help="Path to the output markdown file (optional)")
-    parser.add_argument('--model', type=str, default="gemini-2.5-flash-preview-04-17", 
-                        help="Gemini model to use (default: gemini-2.5-flash-preview-04-17)")
-    args = parser.parse_args()
-
-    # Find prompt file
-    prompt_file = find_prompt_file(args.prompt)
-    prompt_name = prompt_file.stem
-    
-    # Set up output file
-    submission_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-    reports_dir = Path(REPORTS_DIR)
-    os.makedirs(reports_dir, exist_ok=True)
-    
-    output_file = args.output if args.output else reports_dir / f"gemini_{prompt_name}_{submission_time}.md"
-
-    # Initialize submitter and process prompt
-    submitter = GeminiPromptSubmitter()
-    prompt = submitter.read_prompt(prompt_file)
-    response = submitter.submit_prompt(prompt, model=args.model)
-    
-    # Save the response
-    formatted_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    submitter.save_response(response, output_file, prompt_name, formatted_time)
+                responses[name] = self._error_response(result.error.message if result.error else "No response returned")
+
+        for name in prompts:
+            if name not in responses:
+                logger.error(f"No batch result returned for prompt: {name}")
+                responses[name] = self._error_response("No result returned by the batch job")
+        return responses
 
 if __name__ == "__main__":
-    main()
+    # Kept as an entry point for existing usage; the command line lives in submit.py
+    from submit import main
+    main(provider="gemini")
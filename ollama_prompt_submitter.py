@@ -5,35 +5,83 @@
 """
 Ollama Prompt Submitter
 Submits custom prompts to a local Ollama LLM and saves the responses as markdown files.
+
+Multiple prompts are generated in parallel, up to the number of parallel slots of
+the Ollama server. The server only handles one request per model at a time
+unless it is started with more slots, e.g.:
+
+    OLLAMA_NUM_PARALLEL=8 ollama serve
+
+The number of in-flight requests follows OLLAMA_NUM_PARALLEL (default: 4) and
+can be overridden with --max-concurrency.
+
+Ollama silently drops the start of prompts longer than its context window.
+Prompts are checked against it first, but with an estimated token count, since
+the Ollama client has no tokenizer. The estimate errs high, which catches most
+overlong prompts but cannot guarantee it for every model. --context-limit also
+sets the window (num_ctx) the model is run with.
 """
 
 import os
+import math
 import logging
-from pathlib import Path
-from datetime import datetime
-import argparse
-import sys
-import ollama
-
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import functools
+import httpx
+
+from common import CircuitBreaker
+from submitter_base import BaseSubmitter
+
 logger = logging.getLogger(__name__)
 
-PROMPTS_DIR = "prompts"
-REPORTS_DIR = "reports"
 DEFAULT_MODEL = "gemma3:12b-it-q8_0"
+DEFAULT_NUM_PARALLEL = 4
+DEFAULT_NUM_CTX = 4096
+# Deliberately high token estimates: English averages about four characters per token,
+# but CJK and other non-Latin scripts often take a token per character or more
+ASCII_CHARS_PER_TOKEN = 3
+NON_ASCII_BYTES_PER_TOKEN = 2
+
+def get_num_parallel() -> int:
+    """Return the number of parallel generation slots configured for the Ollama server."""
+    value = os.getenv('OLLAMA_NUM_PARALLEL')
+    if not value:
+        return DEFAULT_NUM_PARALLEL
+    try:
+        num_parallel = int(value)
+    except ValueError:
+        logger.warning(f"Invalid OLLAMA_NUM_PARALLEL value '{value}', using {DEFAULT_NUM_PARALLEL}")
+        return DEFAULT_NUM_PARALLEL
+    return max(num_parallel, 1)
+
+@functools.cache
+def _get_ollama():
+    """Import the Ollama SDK on first use, so --help and other providers don't pay for it."""
+    import ollama
+    return ollama
 
-class OllamaPromptSubmitter:
-    def __init__(self, model: str = None):
-        """Initialize with the specified Ollama model."""
-        self.model = model or DEFAULT_MODEL
+class OllamaPromptSubmitter(BaseSubmitter):
+    name = "Ollama"
+    report_prefix = "ollama"
+    default_model = DEFAULT_MODEL
+    # A local server has no request quota
+    default_rpm = None
+    supports_list_models = True
+    context_limit = DEFAULT_NUM_CTX
+    reserved_tokens = 1024
+    circuit_breaker = CircuitBreaker("Ollama")
+
+    def __init__(self, model: str = None, **kwargs):
+        """Initialize with the specified Ollama model; other arguments are passed on to BaseSubmitter."""
+        super().__init__(model=model, **kwargs)
+        ollama = _get_ollama()
+        self.client = ollama.AsyncClient()
         logger.info(f"Initialized Ollama client with model: {self.model}")
-        
+
         # Check if model is available, pull if not
         try:
             response = ollama.list()
             model_found = False
-            
+
             # Check if the model is in the list of available models
             if 'models' in response and response['models']:
                 for model_info in response['models']:
@@ -43,111 +91,28 @@ class OllamaPromptSubmitter:
                         model_found = True
                         logger.info(f"Found model: {model_name}")
                         break
-            
+
             if not model_found:
                 logger.info(f"Model '{self.model}' not found locally. Attempting to pull...")
                 ollama.pull(self.model)
                 logger.info(f"Successfully pulled model: {self.model}")
-                
+
         except Exception as e:
             logger.error(f"Error initializing Ollama: {str(e)}")
             logger.error("Make sure the Ollama service is running. You can start it with 'ollama serve'")
             raise
 
-    def read_prompt(self, prompt_file: Path) -> str:
-        """Read the prompt from a text file."""
-        with open(prompt_file, 'r', encoding='utf-8') as f:
-            return f.read()
+    @classmethod
+    def default_max_concurrency(cls) -> int:
+        """One request per parallel slot of the Ollama server."""
+        return get_num_parallel()
 
-    def submit_prompt(self, prompt: str) -> str:
-        """Submit the prompt to the local Ollama model and get the response."""
-        logger.info(f"Submitting prompt to Ollama model '{self.model}'. Prompt length: {len(prompt)}")
-        
-        try:
-            response = ollama.generate(
-                model=self.model,
-                prompt=prompt,
-                options={"temperature": 0.5, "num_ctx": 4096}
-            )
-            logger.info("Ollama generation complete. Response received.")
-            return response.get("response", "No response generated.")
-            
-        except Exception as e:
-            error_msg = f"Error calling Ollama API: {str(e)}"
-            logger.error(error_msg)
-            return f"# Ollama API Error\n\n```\n{error_msg}\n```"
-
-    def save_response(self, response: str, output_file: Path, prompt_name: str, submission_time: str):
-        """Save the Ollama response to a markdown file."""
-        try:
-            # Add metadata to the top of the file
-            metadata = (
-                f"---\n"
-                f"model: {self.model}\n"
-                f"prompt: {prompt_name}\n"
-                f"submitted_at: {submission_time}\n"
-                f"---\n\n"
-            )
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(metadata + response)
-                
-            logger.info(f"Response saved to {output_file}")
-        except Exception as e:
-            logger.error(f"Error saving response: {str(e)}")
-
-def find_prompt_file(prompt_name: str = None) -> Path:
-    """Find a prompt file by name or list available prompts if none specified."""
-    prompts_dir = Path(PROMPTS_DIR)
-    os.makedirs(prompts_dir, exist_ok=True)
-    
-    if not prompt_name:
-        # List available prompts
-        prompts = list(prompts_dir.glob("*.txt"))
-        if not prompts:
-            logger.error(f"No prompt files found in {prompts_dir}")
-            print(f"No prompt files found in {prompts_dir}. Please create a prompt file in the 'prompts' directory.")
-            sys.exit(1)
-        
-        print("Available prompts:")
-        for i, prompt in enumerate(prompts, 1):
-            print(f"{i}. {prompt.stem}")
-        
-        # Ask user to select a prompt
-        selection = input("\nEnter prompt number to use: ")
-        try:
-            selected_idx = int(selection) - 1
-            if 0 <= selected_idx < len(prompts):
-                return prompts[selected_idx]
-            else:
-                logger.error("Invalid selection")
-                sys.exit(1)
-        except ValueError:
-            logger.error("Invalid input")
-            sys.exit(1)
-    else:
-        # Find prompt by name
-        prompt_file = prompts_dir / f"{prompt_name}.txt"
-        if not prompt_file.exists():
-            logger.error(f"Prompt file not found: {prompt_file}")
-            print(f"Error: Prompt file '{prompt_name}.txt' not found in the 'prompts' directory.")
-            sys.exit(1)
-        return prompt_file
-
-def main():
-    parser = argparse.ArgumentParser(description="Ollama Prompt Submitter")
-    parser.add_argument('--prompt', type=str, help="Name of the prompt file to use (without .txt extension)")
-    parser.add_argument('--output', type=Path, help="Path to the output markdown file (optional)")
-    parser.add_argument('--model', type=str, default=DEFAULT_MODEL, 
-                      help=f"Ollama model to use (default: {DEFAULT_MODEL})")
-    parser.add_argument('--list-models', action='store_true', help="List available Ollama models and exit")
-    
-    args = parser.parse_args()
-    
-    if args.list_models:
+    @classmethod
+    def print_models(cls):
+        """Print the models available on the local Ollama server."""
         try:
             print("Available Ollama models:")
-            response = ollama.list()
+            response = _get_ollama().list()
             if 'models' in response:
                 for model in response['models']:
                     model_name = model.get('name', 'unnamed')
@@ -160,37 +125,37 @@ def main():
                     print(f"- {model_name} (size: {model_size}, modified: {modified})")
             else:
                 print("No models found. Try running 'ollama pull <model_name>' first.")
-            return
         except Exception as e:
             print(f"Error listing models: {str(e)}")
             print("Make sure the Ollama service is running. You can start it by running 'ollama serve' in a terminal.")
-            return
-
-    # Find prompt file
-    prompt_file = find_prompt_file(args.prompt)
-    prompt_name = prompt_file.stem
-    
-    # Set up output file
-    submission_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-    reports_dir = Path(REPORTS_DIR)
-    os.makedirs(reports_dir, exist_ok=True)
-    
-    output_file = args.output if args.output else reports_dir / f"ollama_{prompt_name}_{submission_time}.md"
-
-    # Initialize submitter and process prompt
-    try:
-        submitter = OllamaPromptSubmitter(model=args.model)
-        prompt = submitter.read_prompt(prompt_file)
-        response = submitter.submit_prompt(prompt)
-        
-        # Save the response
-        formatted_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        submitter.save_response(response, output_file, prompt_name, formatted_time)
-        print(f"\nResponse saved to: {output_file}")
-        
-    except Exception as e:
-        logger.error(f"An error occurred: {str(e)}")
-        sys.exit(1)
+
+    def _metadata_extras(self, model: str) -> dict:
+        return {"model": model}
+
+    async def _count_tokens(self, prompt: str, model: str) -> int:
+        """Estimate the prompt tokens on the high side, since the Ollama client has no tokenizer."""
+        ascii_chars = len(prompt.encode('ascii', 'ignore'))
+        non_ascii_bytes = len(prompt.encode('utf-8')) - ascii_chars
+        return math.ceil(ascii_chars / ASCII_CHARS_PER_TOKEN + non_ascii_bytes / NON_ASCII_BYTES_PER_TOKEN)
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """Connection errors, timeouts and overloaded-server responses are worth retrying."""
+        if isinstance(error, _get_ollama().ResponseError):
+            return error.status_code == 429 or error.status_code >= 500
+        return isinstance(error, (ConnectionError, httpx.TransportError))
+
+    async def _call_api(self, prompt: str, model: str):
+        """Call the local Ollama model and yield the generated text as it arrives, raising on failure."""
+        stream = await self.client.generate(
+            model=model,
+            prompt=prompt,
+            options={"temperature": 0.5, "num_ctx": self.context_limit},
+            stream=True
+        )
+        async for chunk in stream:
+            yield chunk.get("response") or ""
 
 if __name__ == "__main__":
-    main()
+    # Kept as an entry point for existing usage; the command line lives in submit.py
+    from submit import main
+    main(provider="ollama")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Prompt Submitter
+Submits custom prompts to xAI, Google Gemini or a local Ollama model and saves the responses as markdown files.
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime
+import argparse
+import sys
+from pathlib import Path
+
+from common import DEFAULT_SIMILARITY_THRESHOLD, RateLimiter, ResponseCache, SemanticCache
+from gemini_api import GeminiPromptSubmitter
+from ollama_prompt_submitter import OllamaPromptSubmitter
+from submit_server import DEFAULT_SOCKET, ServerAlreadyRunningError, run_prompts, serve
+from submitter_base import REPORTS_DIR, TRIM_MODES, BaseSubmitter, find_prompt_files, process_batch, process_prompts
+from xai_prompt_submitter import XAIPromptSubmitter
+
+logger = logging.getLogger(__name__)
+
+PROVIDERS = {
+    "gemini": GeminiPromptSubmitter,
+    "xai": XAIPromptSubmitter,
+    "ollama": OllamaPromptSubmitter,
+}
+
+def _add_prompt_arguments(parser: argparse.ArgumentParser) -> list[argparse.Action]:
+    return [
+        parser.add_argument('--prompt', type=str, nargs='+',
+                            help="Name(s) or glob pattern(s) of the prompt files to use (without .txt extension)"),
+        parser.add_argument('--output', type=Path,
+                            help="Path to the output markdown file (optional, single prompt only)"),
+    ]
+
+def _add_submitter_arguments(parser: argparse.ArgumentParser, provider: str = None) -> list[argparse.Action]:
+    actions = []
+    if provider:
+        submitter_cls = PROVIDERS[provider]
+        model_default = submitter_cls.default_model
+        concurrency_default = submitter_cls.default_max_concurrency()
+        rpm_default = submitter_cls.default_rpm or "unlimited"
+        context_default = submitter_cls.context_limit
+        reserved_default = submitter_cls.reserved_tokens
+    else:
+        actions.append(parser.add_argument('--provider', choices=sorted(PROVIDERS), help="API provider to submit to"))
+        model_default = concurrency_default = rpm_default = "depends on the provider"
+        context_default = reserved_default = "depends on the provider"
+
+    actions += [
+        parser.add_argument('--model', type=str, help=f"Model to use (default: {model_default})"),
+        parser.add_argument('--max-concurrency', type=int,
+                            help=f"Maximum number of requests in flight (default: {concurrency_default})"),
+        parser.add_argument('--rpm', type=float,
+                            help=f"Maximum requests per minute, 0 to disable (default: {rpm_default})"),
+        parser.add_argument('--tpm', type=float, default=None,
+                            help="Maximum prompt tokens per minute (default: unlimited)"),
+        parser.add_argument('--context-limit', type=int,
+                            help=f"Context window of the model in tokens (default: {context_default})"),
+        parser.add_argument('--reserve-tokens', type=int,
+                            help=f"Tokens of the context window kept free for the response (default: {reserved_default})"),
+        parser.add_argument('--trim', choices=TRIM_MODES, default="error",
+                            help="What to do with prompts that don't fit: fail, or drop the middle of the prompt "
+                                 "(default: error)"),
+        parser.add_argument('--no-cache', action='store_true', help="Always call the API, ignoring cached responses"),
+        parser.add_argument('--cache-ttl', type=float, default=None,
+                            help="Seconds to keep cached responses (default: keep until evicted)"),
+        parser.add_argument('--semantic-cache', action='store_true',
+                            help="Also reuse responses of similar earlier prompts (requires sentence-transformers and faiss)"),
+        parser.add_argument('--threshold', type=float, default=DEFAULT_SIMILARITY_THRESHOLD,
+                            help=f"Minimum cosine similarity for a semantic cache hit "
+                                 f"(default: {DEFAULT_SIMILARITY_THRESHOLD})"),
+    ]
+    return actions
+
+def _add_socket_argument(parser: argparse.ArgumentParser):
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET,
+                        help=f"Unix socket of the submit server (default: {DEFAULT_SOCKET})")
+
+def _keep_main_defaults(actions: list[argparse.Action]):
+    """Leave unset subcommand options out of the result, so they don't overwrite values given before the subcommand."""
+    for action in actions:
+        action.default = argparse.SUPPRESS
+
+def build_parser(provider: str = None) -> argparse.ArgumentParser:
+    """Build the command line parser, for one fixed provider or with a --provider option."""
+    name = PROVIDERS[provider].name if provider else None
+    parser = argparse.ArgumentParser(description=f"{name} Prompt Submitter" if name else "Prompt Submitter")
+    _add_prompt_arguments(parser)
+    _add_submitter_arguments(parser, provider)
+    parser.add_argument('--batch', action='store_true',
+                        help="Submit all prompts as one batch job (cheaper, but may take up to 24h; xAI and Gemini only)")
+    parser.add_argument('--list-models', action='store_true', help="List available models and exit (Ollama only)")
+
+    # The options are accepted before or after the subcommand; the main parser supplies their defaults
+    subparsers = parser.add_subparsers(dest='command', metavar='{serve,run}',
+                                       help="Optionally keep a submit server running and send prompts to it")
+    serve_parser = subparsers.add_parser(
+        'serve', help="Run a long-lived submit server that keeps the API client, connection pool and caches warm")
+    _keep_main_defaults(_add_submitter_arguments(serve_parser, provider))
+    _add_socket_argument(serve_parser)
+    run_parser = subparsers.add_parser(
+        'run', help="Send prompts to a running submit server, which looks them up in its prompts directory")
+    _keep_main_defaults(_add_prompt_arguments(run_parser))
+    _add_socket_argument(run_parser)
+    return parser
+
+def build_submitter(args: argparse.Namespace, submitter_cls: type[BaseSubmitter]) -> BaseSubmitter:
+    """Create the submitter with its rate limiter and caches, exiting on failure."""
+    rpm = args.rpm if args.rpm is not None else submitter_cls.default_rpm
+    rate_limiter = RateLimiter(rpm=rpm, tpm=args.tpm)
+    cache = None if args.no_cache else ResponseCache(ttl=args.cache_ttl)
+    try:
+        semantic_cache = SemanticCache(threshold=args.threshold) if args.semantic_cache else None
+        return submitter_cls(model=args.model, rate_limiter=rate_limiter, cache=cache,
+                             semantic_cache=semantic_cache, context_limit=args.context_limit,
+                             reserved_tokens=args.reserve_tokens, trim=args.trim)
+    except Exception as e:
+        logger.error(f"An error occurred: {str(e)}")
+        sys.exit(1)
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser):
+    """Send the selected prompts to a running submit server."""
+    if not args.prompt:
+        parser.error("run requires --prompt")
+    if args.output and len(args.prompt) > 1:
+        parser.error("--output can only be used with a single prompt")
+
+    try:
+        ok = asyncio.run(run_prompts(args.socket, args.prompt, args.output))
+    except (FileNotFoundError, ConnectionRefusedError):
+        logger.error(f"No submit server listening on {args.socket}. "
+                     f"Start one with 'submit.py serve --provider <provider>'")
+        sys.exit(1)
+    if not ok:
+        sys.exit(1)
+
+def main(argv: list[str] = None, provider: str = None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = build_parser(provider)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run(args, parser)
+        return
+
+    if not (provider or args.provider):
+        parser.error("the following arguments are required: --provider")
+    submitter_cls = PROVIDERS[provider or args.provider]
+    max_concurrency = args.max_concurrency or submitter_cls.default_max_concurrency()
+
+    if args.command == 'serve':
+        submitter = build_submitter(args, submitter_cls)
+        try:
+            asyncio.run(serve(submitter, args.socket, max_concurrency))
+        except ServerAlreadyRunningError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        return
+
+    if args.list_models:
+        if not submitter_cls.supports_list_models:
+            parser.error(f"--list-models is not supported for {submitter_cls.name}")
+        submitter_cls.print_models()
+        return
+
+    if args.batch and not submitter_cls.supports_batch:
+        parser.error(f"--batch is not supported for {submitter_cls.name}")
+
+    # Find prompt files
+    prompt_files = find_prompt_files(args.prompt)
+    if args.output and len(prompt_files) > 1:
+        parser.error("--output can only be used with a single prompt")
+
+    # Set up output directory
+    # One timestamp for the report file names and their metadata
+    submitted_at = datetime.now()
+    reports_dir = Path(REPORTS_DIR)
+    os.makedirs(reports_dir, exist_ok=True)
+
+    # Initialize submitter and process prompts
+    submitter = build_submitter(args, submitter_cls)
+    if args.batch:
+        asyncio.run(process_batch(submitter, prompt_files, args.output, submitted_at))
+    else:
+        asyncio.run(process_prompts(submitter, prompt_files, args.output, submitted_at, max_concurrency))
+
+if __name__ == "__main__":
+    main()
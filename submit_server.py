@@ -0,0 +1,157 @@
+"""
+Long-running submit server and its client.
+
+`submit.py serve` keeps one submitter (SDK imports, HTTP connection pool,
+rate limiter and caches) alive and accepts prompts over a unix socket, so
+repeated submissions skip the interpreter and client start-up cost.
+`submit.py run` is the thin client that sends prompt names to it.
+
+Prompt names and glob patterns are resolved against the server's prompts
+directory. Its index is built once and, with watchdog installed, kept up to
+date as prompt files are added or removed.
+
+Protocol: one JSON request per connection, terminated by a newline,
+{"prompts": ["name or pattern", ...], "output": "/abs/path.md" or null}, answered with
+{"reports": [{"prompt": "name", "output": "/abs/report.md"} or
+{"prompt": "name", "error": "..."}, ...]} or {"error": "..."}. Prompts matched by
+several names or patterns are submitted once. Default report names get a numeric
+suffix when a report of the same name already exists.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+from datetime import datetime
+from pathlib import Path
+
+from submitter_base import (BaseSubmitter, get_prompt_index, report_path, resolve_prompt_names,
+                            submit_prompt_file)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/genai_submit.sock"
+
+class ServerAlreadyRunningError(RuntimeError):
+    """Raised when another submit server is already listening on the socket."""
+
+async def _remove_stale_socket(socket_path: str):
+    """Remove a socket file left behind by a server that did not shut down cleanly.
+
+    Raises ServerAlreadyRunningError if a server still answers on it.
+    """
+    if not os.path.exists(socket_path):
+        return
+    try:
+        _, writer = await asyncio.open_unix_connection(socket_path)
+    except ConnectionRefusedError:
+        os.unlink(socket_path)
+        return
+    writer.close()
+    raise ServerAlreadyRunningError(f"A submit server is already listening on {socket_path}")
+
+async def serve(submitter: BaseSubmitter, socket_path: str, max_concurrency: int):
+    """Accept prompt requests on socket_path until interrupted, with at most max_concurrency in flight."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    # Report files being written, so concurrent requests never stream into the same file
+    claimed = set()
+
+    def claim_report(prompt_name: str, output: Path, submitted_at: datetime) -> Path:
+        if output:
+            output_file = output.resolve()
+            if output_file in claimed:
+                raise FileExistsError(f"{output_file} is already being written by another request")
+        else:
+            # Timestamps have one-second resolution, so number the reports of repeated requests
+            base = report_path(submitter, prompt_name, submitted_at).resolve()
+            output_file = base
+            n = 1
+            while output_file in claimed or output_file.exists():
+                output_file = base.with_name(f"{base.stem}_{n}{base.suffix}")
+                n += 1
+        claimed.add(output_file)
+        return output_file
+
+    async def submit(prompt_file: Path, output: Path, submitted_at: datetime) -> dict:
+        output_file = claim_report(prompt_file.stem, output, submitted_at)
+        try:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            async with semaphore:
+                ok = await submit_prompt_file(submitter, prompt_file, output_file, submitted_at)
+        except Exception as e:
+            # Reported per prompt, so the other prompts of the request still get their replies
+            logger.error(f"Error processing prompt {prompt_file.stem}: {str(e)}")
+            return {"prompt": prompt_file.stem, "error": str(e)}
+        finally:
+            claimed.discard(output_file)
+        if ok:
+            return {"prompt": prompt_file.stem, "output": str(output_file)}
+        return {"prompt": prompt_file.stem, "error": f"Submission failed, see {output_file}"}
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        line = await reader.readline()
+        if not line:
+            # A connection without a request, e.g. another server checking the socket
+            writer.close()
+            return
+        try:
+            request = json.loads(line)
+            prompt_files = resolve_prompt_names(request["prompts"])
+            output = Path(request["output"]) if request.get("output") else None
+            if output and len(prompt_files) > 1:
+                raise ValueError("output can only be used with a single prompt")
+            submitted_at = datetime.now()
+            reports = await asyncio.gather(*(submit(prompt_file, output, submitted_at) for prompt_file in prompt_files))
+            reply = {"reports": reports}
+        except Exception as e:
+            logger.error(f"Error handling request: {str(e)}")
+            reply = {"error": str(e)}
+        try:
+            writer.write(json.dumps(reply).encode("utf-8") + b"\n")
+            await writer.drain()
+        finally:
+            writer.close()
+
+    await _remove_stale_socket(socket_path)
+    prompt_index = get_prompt_index()
+    prompt_index.watch()
+    server = await asyncio.start_unix_server(handle, path=socket_path)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    logger.info(f"{submitter.name} submit server listening on {socket_path}")
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        prompt_index.stop()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+    logger.info("Submit server stopped")
+
+async def request(socket_path: str, prompts: list[str], output: Path = None) -> dict:
+    """Send prompt names or patterns to the server and wait for its reply."""
+    reader, writer = await asyncio.open_unix_connection(socket_path)
+    try:
+        payload = {"prompts": prompts, "output": str(output.resolve()) if output else None}
+        writer.write(json.dumps(payload).encode("utf-8") + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+async def run_prompts(socket_path: str, prompts: list[str], output: Path = None) -> bool:
+    """Send prompt names or patterns to the server as one request; return whether all of them succeeded."""
+    reply = await request(socket_path, prompts, output)
+    if "error" in reply:
+        logger.error(reply["error"])
+        return False
+    ok = True
+    for report in reply["reports"]:
+        if "error" in report:
+            logger.error(f"{report['prompt']}: {report['error']}")
+            ok = False
+        else:
+            logger.info(f"{report['prompt']}: response saved to {report['output']}")
+    return ok
@@ -0,0 +1,388 @@
+"""
+Base class and shared helpers for the prompt submitters.
+
+Subclasses only implement the provider-specific parts: creating the client,
+the streaming API call, which errors are worth retrying and any extra report
+metadata. Reading prompts, rate limiting, caching, retries, writing reports
+and the concurrent runner are shared here, so every provider gets them.
+"""
+import asyncio
+import logging
+import math
+import sys
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+
+import aiofiles
+
+from common import (DEFAULT_RPM, CircuitBreaker, PromptIndex, RateLimiter, ResponseCache, SemanticCache,
+                    cached_stream, retry_stream)
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_DIR = "prompts"
+REPORTS_DIR = "reports"
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_RESERVED_TOKENS = 8192
+CHARS_PER_TOKEN = 4
+TRIM_MODES = ("error", "middle-out")
+TRIM_MARKER = "\n\n[...]\n\n"
+SAVE_BUFFER_SIZE = 1 << 16
+# Report file names and report metadata show the same submission time in these formats
+FILE_TIME_FORMAT = '%Y%m%d_%H%M%S'
+METADATA_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+class PromptTooLongError(ValueError):
+    """Raised when a prompt does not fit the model's context window and trimming is off."""
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for providers without a local tokenizer."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+class BaseSubmitter(ABC):
+    # Provider name used in log messages and reports, e.g. "Gemini"
+    name: str = None
+    # Prefix of the generated report file names, e.g. "gemini"
+    report_prefix: str = None
+    default_model: str = None
+    default_rpm: float = DEFAULT_RPM
+    # Subclasses that set these override submit_batch and print_models
+    supports_batch = False
+    supports_list_models = False
+    # Context window of the default model in tokens, None to skip the prompt length check
+    context_limit: int = None
+    # Tokens kept free for the response
+    reserved_tokens: int = DEFAULT_RESERVED_TOKENS
+    # Each subclass defines its own, shared by all its instances, so a degraded endpoint is detected process-wide
+    circuit_breaker: CircuitBreaker = None
+
+    def __init__(self, model: str = None, rate_limiter: RateLimiter = None, cache: ResponseCache = None,
+                 semantic_cache: SemanticCache = None, context_limit: int = None, reserved_tokens: int = None,
+                 trim: str = "error"):
+        """Initialize with the model, plus an optional rate limiter and response caches shared between submitters.
+
+        Prompts longer than context_limit - reserved_tokens are rejected, or with trim="middle-out"
+        shortened by dropping their middle. Subclasses set self.client; while it is None, responses
+        are simulated.
+        """
+        self.model = model or self.default_model
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        self.context_limit = context_limit or self.context_limit
+        self.reserved_tokens = reserved_tokens if reserved_tokens is not None else self.reserved_tokens
+        if trim not in TRIM_MODES:
+            raise ValueError(f"Unknown trim mode '{trim}', expected one of: {', '.join(TRIM_MODES)}")
+        self.trim = trim
+        if self.context_limit and self.reserved_tokens >= self.context_limit:
+            raise ValueError(f"Reserved tokens ({self.reserved_tokens}) must be less than the context limit "
+                             f"({self.context_limit})")
+        self.client = None
+
+    @classmethod
+    def default_max_concurrency(cls) -> int:
+        """Default number of requests in flight."""
+        return DEFAULT_MAX_CONCURRENCY
+
+    @classmethod
+    def print_models(cls):
+        """Print the models available to this provider; only called when supports_list_models is set."""
+        raise NotImplementedError(f"Listing models is not supported for {cls.name}")
+
+    @abstractmethod
+    def _call_api(self, prompt: str, model: str):
+        """Call the provider API and yield the response text as it arrives, raising on failure."""
+
+    @abstractmethod
+    def _is_retryable(self, error: Exception) -> bool:
+        """Return whether an error from _call_api is transient and worth retrying."""
+
+    def _metadata_extras(self, model: str) -> dict:
+        """Extra fields for the report metadata header."""
+        return {}
+
+    async def _count_tokens(self, prompt: str, model: str) -> int:
+        """Count the prompt tokens for the model; estimated from the length unless a subclass knows better."""
+        return estimate_tokens(prompt)
+
+    async def _truncate_middle(self, prompt: str, model: str, max_tokens: int, tokens: int) -> str:
+        """Keep the start and end of a prompt of the given token count so it fits in max_tokens.
+
+        Without a local tokenizer the cut is made by characters and re-counted until it fits.
+        fit_prompt ensures max_tokens leaves room beyond the trim marker.
+        """
+        marker_tokens = await self._count_tokens(TRIM_MARKER, model)
+        keep = len(prompt)
+        # keep shrinks every round, and at 0 only the marker is left, which fits
+        while tokens > max_tokens and keep > 0:
+            # Scale by the overshoot, with a small margin so this rarely needs a second round
+            keep = max(int(keep * (max_tokens - marker_tokens) / tokens * 0.98), 0)
+            head = keep // 2
+            trimmed = prompt[:head] + TRIM_MARKER + prompt[len(prompt) - (keep - head):]
+            tokens = await self._count_tokens(trimmed, model)
+        return trimmed
+
+    async def fit_prompt(self, prompt: str, model: str = None) -> str:
+        """Return the prompt if it fits the context window, trimmed if allowed, raising PromptTooLongError otherwise."""
+        if not self.context_limit:
+            return prompt
+        model = model or self.model
+        max_tokens = self.context_limit - self.reserved_tokens
+        # Every token covers at least one byte, so most prompts fit without being tokenized
+        if len(prompt.encode('utf-8')) <= max_tokens:
+            return prompt
+
+        tokens = await self._count_tokens(prompt, model)
+        if tokens <= max_tokens:
+            return prompt
+        message = (f"Prompt has {tokens} tokens, more than the {max_tokens} available "
+                   f"({self.context_limit} context limit - {self.reserved_tokens} reserved for the response)")
+        if self.trim != "middle-out":
+            raise PromptTooLongError(message)
+        if max_tokens <= await self._count_tokens(TRIM_MARKER, model):
+            raise PromptTooLongError(f"{message}, too few to keep any of it when trimming")
+        logger.warning(f"{message}. Dropping the middle of the prompt.")
+        return await self._truncate_middle(prompt, model, max_tokens, tokens)
+
+    async def read_prompt(self, prompt_file: Path) -> str:
+        """Read the prompt from a text file."""
+        async with aiofiles.open(prompt_file, 'r', encoding='utf-8') as f:
+            return await f.read()
+
+    def _metadata(self, prompt_name: str, submission_time: str, model: str) -> str:
+        """Build the metadata header written at the top of each report."""
+        fields = {"prompt": prompt_name, "submitted_at": submission_time, **self._metadata_extras(model)}
+        return "---\n" + "".join(f"{key}: {value}\n" for key, value in fields.items()) + "---\n\n"
+
+    def _simulated_response(self) -> str:
+        return (
+            f"# {self.name} Response (Simulation)\n\n"
+            f"This is a simulated response because the {self.name} API client was not available."
+        )
+
+    def _error_response(self, error) -> str:
+        return f"# {self.name} API Error\n\n```\n{error}\n```"
+
+    @cached_stream
+    @retry_stream
+    async def _stream(self, prompt: str, model: str):
+        """Rate-limit and stream one API call; cached_stream and retry_stream wrap this once for all providers."""
+        if self.rate_limiter:
+            await self.rate_limiter.acquire(tokens=estimate_tokens(prompt))
+        async for chunk in self._call_api(prompt, model):
+            yield chunk
+
+    async def asubmit_prompt(self, prompt: str, output_file: Path, prompt_name: str, submission_time: str,
+                             model: str = None) -> bool:
+        """Submit the prompt and stream the response into a markdown file; return whether it succeeded."""
+        model = model or self.model
+        ok = True
+        logger.info(f"Submitting prompt to {self.name}. Prompt length: {len(prompt)}. Model: {model}")
+
+        try:
+            # Line buffered, so the report can be followed (e.g. with tail -f) while it is generated
+            async with aiofiles.open(output_file, 'w', encoding='utf-8', buffering=1) as f:
+                await f.write(self._metadata(prompt_name, submission_time, model))
+                if self.client:
+                    received = False
+                    try:
+                        prompt = await self.fit_prompt(prompt, model)
+                        async for chunk in self._stream(prompt, model):
+                            await f.write(chunk)
+                            received = received or bool(chunk)
+                        if not received:
+                            await f.write("No response generated.")
+                        logger.info(f"{self.name} submission complete. Response received.")
+                    except Exception as e:
+                        logger.error(f"Error calling {self.name} API: {str(e)}")
+                        # Keep any partial response and append the error after it
+                        if received:
+                            await f.write("\n\n")
+                        await f.write(self._error_response(e))
+                        ok = False
+                else:
+                    logger.info(f"[SIMULATION] Would send prompt to {self.name} here...")
+                    await f.write(self._simulated_response())
+            logger.info(f"Response saved to {output_file}")
+        except OSError as e:
+            logger.error(f"Error saving response: {str(e)}")
+            ok = False
+        return ok
+
+    async def submit_batch(self, prompts: dict[str, str], model: str = None) -> dict[str, str]:
+        """Submit prompts (keyed by prompt name) as one batch job and return the responses by prompt name.
+
+        Only called when supports_batch is set.
+        """
+        raise NotImplementedError(f"Batch jobs are not supported for {self.name}")
+
+    async def save_response(self, response: str, output_file: Path, prompt_name: str, submission_time: str,
+                            model: str = None):
+        """Save a complete response to a markdown file."""
+        try:
+            # Add metadata to the top of the file
+            metadata = self._metadata(prompt_name, submission_time, model or self.model)
+
+            # Written one after the other, so a long response is never copied into a concatenated string
+            async with aiofiles.open(output_file, 'w', encoding='utf-8', buffering=SAVE_BUFFER_SIZE) as f:
+                await f.write(metadata)
+                await f.write(response)
+
+            logger.info(f"Response saved to {output_file}")
+        except Exception as e:
+            logger.error(f"Error saving response: {str(e)}")
+
+_prompt_index = None
+
+def get_prompt_index() -> PromptIndex:
+    """Return the index of PROMPTS_DIR, scanned on first use and shared by all lookups."""
+    global _prompt_index
+    if _prompt_index is None:
+        _prompt_index = PromptIndex(Path(PROMPTS_DIR))
+    return _prompt_index
+
+def find_prompt_file(prompt_name: str = None) -> Path:
+    """Find a prompt file by name or list available prompts if none specified."""
+    prompts_dir = Path(PROMPTS_DIR)
+    index = get_prompt_index()
+
+    if not prompt_name:
+        # List available prompts
+        prompts = index.paths()
+        if not prompts:
+            logger.error(f"No prompt files found in {prompts_dir}. Please create a prompt file in the '{PROMPTS_DIR}' directory.")
+            sys.exit(1)
+
+        print("Available prompts:")
+        for i, prompt in enumerate(prompts, 1):
+            print(f"{i}. {prompt.stem}")
+
+        # Ask user to select a prompt
+        selection = input("\nEnter prompt number to use: ")
+        try:
+            selected_idx = int(selection) - 1
+            if 0 <= selected_idx < len(prompts):
+                return prompts[selected_idx]
+            else:
+                logger.error("Invalid selection")
+                sys.exit(1)
+        except ValueError:
+            logger.error("Invalid input")
+            sys.exit(1)
+    else:
+        # Find prompt by name; names with a subdirectory are not in the index
+        prompt_file = index.get(prompt_name) or prompts_dir / f"{prompt_name}.txt"
+        if not prompt_file.exists():
+            logger.error(f"Prompt file not found: {prompt_file}")
+            sys.exit(1)
+        return prompt_file
+
+def resolve_prompt_name(name: str) -> list[Path]:
+    """Return the prompt files for a name or glob pattern, raising FileNotFoundError if there are none."""
+    index = get_prompt_index()
+    if any(ch in name for ch in "*?["):
+        matches = index.match(f"{name}.txt")
+        if not matches:
+            raise FileNotFoundError(f"No prompt files match pattern: {name}")
+        return matches
+    # Names with a subdirectory are not in the index
+    prompt_file = index.get(name) or Path(PROMPTS_DIR) / f"{name}.txt"
+    if not prompt_file.exists():
+        raise FileNotFoundError(f"Prompt file not found: {prompt_file}")
+    return [prompt_file]
+
+def resolve_prompt_names(prompt_names: list[str]) -> list[Path]:
+    """Return the prompt files for several names or glob patterns, each file once, in order.
+
+    Raises FileNotFoundError for a name or pattern without prompt files.
+    """
+    prompt_files = [prompt_file for name in prompt_names for prompt_file in resolve_prompt_name(name)]
+    # Drop duplicates from overlapping patterns while keeping the order
+    return list(dict.fromkeys(prompt_files))
+
+def find_prompt_files(prompt_names: list[str] = None) -> list[Path]:
+    """Resolve prompt names or glob patterns to prompt files, or ask the user to pick one."""
+    if not prompt_names:
+        return [find_prompt_file()]
+    try:
+        return resolve_prompt_names(prompt_names)
+    except FileNotFoundError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+def report_path(submitter: BaseSubmitter, prompt_name: str, submitted_at: datetime, output: Path = None) -> Path:
+    """Return the report file for a prompt: output if given, otherwise a timestamped file in REPORTS_DIR."""
+    if output:
+        return output
+    return Path(REPORTS_DIR) / f"{submitter.report_prefix}_{prompt_name}_{submitted_at.strftime(FILE_TIME_FORMAT)}.md"
+
+async def submit_prompt_file(submitter: BaseSubmitter, prompt_file: Path, output_file: Path,
+                             submitted_at: datetime) -> bool:
+    """Read one prompt file and stream its response into output_file; return whether it succeeded.
+
+    API and report write errors are handled here; errors reading the prompt file are raised.
+    """
+    prompt = await submitter.read_prompt(prompt_file)
+    return await submitter.asubmit_prompt(prompt, output_file, prompt_file.stem,
+                                          submitted_at.strftime(METADATA_TIME_FORMAT))
+
+async def process_prompts(submitter: BaseSubmitter, prompt_files: list[Path], output: Path,
+                          submitted_at: datetime, max_concurrency: int):
+    """Submit all prompts concurrently, with at most max_concurrency requests in flight.
+
+    Each response is streamed into its report file as it is generated, and progress
+    is logged as each prompt finishes, so failures show up without waiting for the rest.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def process(prompt_file: Path) -> tuple[str, bool]:
+        output_file = report_path(submitter, prompt_file.stem, submitted_at, output)
+        async with semaphore:
+            try:
+                return prompt_file.stem, await submit_prompt_file(submitter, prompt_file, output_file, submitted_at)
+            except Exception as e:
+                # One broken prompt must not cancel the others still in flight
+                logger.error(f"Error processing prompt {prompt_file.stem}: {str(e)}")
+                return prompt_file.stem, False
+
+    tasks = [process(prompt_file) for prompt_file in prompt_files]
+    total = len(tasks)
+    failed = []
+    for done, task in enumerate(asyncio.as_completed(tasks), 1):
+        prompt_name, ok = await task
+        if not ok:
+            failed.append(prompt_name)
+        logger.info(f"[{done}/{total}] {prompt_name} {'done' if ok else 'failed'}")
+    if failed:
+        logger.error(f"{len(failed)} of {total} prompts failed: {', '.join(failed)}")
+
+async def process_batch(submitter: BaseSubmitter, prompt_files: list[Path], output: Path,
+                        submitted_at: datetime):
+    """Submit all prompts as one batch job and save each response to its own report file."""
+    # An unreadable prompt file fails only its own report, not the whole batch
+    texts = await asyncio.gather(*(submitter.read_prompt(prompt_file) for prompt_file in prompt_files),
+                                 return_exceptions=True)
+    prompts = {}
+    responses = {}
+    for prompt_file, text in zip(prompt_files, texts):
+        try:
+            if isinstance(text, Exception):
+                raise text
+            prompts[prompt_file.stem] = await submitter.fit_prompt(text)
+        except Exception as e:
+            logger.error(f"Skipping prompt {prompt_file.stem}: {str(e)}")
+            responses[prompt_file.stem] = submitter._error_response(e)
+    if prompts:
+        responses.update(await submitter.submit_batch(prompts))
+
+    formatted_time = submitted_at.strftime(METADATA_TIME_FORMAT)
+    await asyncio.gather(*(
+        submitter.save_response(
+            response,
+            report_path(submitter, prompt_name, submitted_at, output),
+            prompt_name,
+            formatted_time
+        )
+        for prompt_name, response in responses.items()
+    ))
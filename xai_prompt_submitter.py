@@ -4,159 +4,190 @@ xAI Prompt Submitter
 Submits custom prompts to xAI API and saves the responses as markdown files.
 """
 import os
+import json
+import asyncio
 import logging
+import functools
 from pathlib import Path
-from datetime import datetime
 from dotenv import load_dotenv
-import argparse
-import sys
 
-from openai import OpenAI
-import httpx
+from common import CircuitBreaker, get_http_client, poll_until
+from submitter_base import TRIM_MARKER, BaseSubmitter, PromptTooLongError
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file in home folder
 env_path = Path.home() / ".env"
 load_dotenv(env_path)
 
-PROMPTS_DIR = "prompts"
-REPORTS_DIR = "reports"
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_DONE_STATUSES = {"completed", "failed", "expired", "cancelled"}
+# Grok's tokenizer is not public; this OpenAI encoding gives close enough counts
+FALLBACK_ENCODING = "o200k_base"
 
-class XAIPromptSubmitter:
-    def __init__(self, api_key: str = None):
-        """Initialize with xAI API key."""
+@functools.cache
+def _get_openai():
+    """Import the OpenAI SDK on first use, so --help and other providers don't pay for it."""
+    import openai
+    return openai
+
+@functools.cache
+def _get_encoding(model: str):
+    """Return the tiktoken encoding for a model, loaded once per model, or None if it can't be loaded."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(FALLBACK_ENCODING)
+    except Exception as e:
+        # tiktoken is not installed, or could not download the encoding on first use
+        logger.warning(f"Could not load tiktoken encoding, estimating prompt tokens instead: {str(e)}")
+        return None
+
+class XAIPromptSubmitter(BaseSubmitter):
+    name = "xAI"
+    report_prefix = "xai"
+    default_model = "grok-3-beta"
+    supports_batch = True
+    context_limit = 131_072
+    circuit_breaker = CircuitBreaker("xAI")
+
+    def __init__(self, api_key: str = None, **kwargs):
+        """Initialize with xAI API key; other arguments are passed on to BaseSubmitter."""
+        super().__init__(**kwargs)
         self.api_key = api_key or os.getenv('XAI_API_KEY')
         if not self.api_key:
             logger.error("XAI_API_KEY not found in environment variables or .env file.")
-        
+
         # Set up OpenAI client if available
-        if OpenAI and self.api_key:
+        if self.api_key:
+            AsyncOpenAI = _get_openai().AsyncOpenAI
             try:
-                # Try using httpx with transport parameter only (no proxies)
-                transport = httpx.HTTPTransport(retries=3)
-                http_client = httpx.Client(transport=transport)
-                self.client = OpenAI(
+                # Reuse the shared HTTP/2 connection pool across all requests
+                self.client = AsyncOpenAI(
                     api_key=self.api_key,
                     base_url="https://api.x.ai/v1",
-                    http_client=http_client
+                    http_client=get_http_client(),
+                    # Retries are handled by retry_stream
+                    max_retries=0
                 )
             except TypeError:
                 # Fall back to default client without custom transport
                 logger.warning("Could not configure custom httpx transport, using default client")
-                self.client = OpenAI(
+                self.client = AsyncOpenAI(
                     api_key=self.api_key,
-                    base_url="https://api.x.ai/v1"
-                )
-        else:
-            self.client = None
-
-    def read_prompt(self, prompt_file: Path) -> str:
-        """Read the prompt from a text file."""
-        with open(prompt_file, 'r', encoding='utf-8') as f:
-            return f.read()
-
-    def submit_prompt(self, prompt: str) -> str:
-        """Submit the prompt to xAI API and get the response."""
-        logger.info(f"Submitting prompt to xAI. Prompt length: {len(prompt)}.")
-        
-        if self.client:
-            try:
-                completion = self.client.chat.completions.create(
-                    model="grok-3-beta",
-                    messages=[{"role": "user", "content": prompt}]
+                    base_url="https://api.x.ai/v1",
+                    max_retries=0
                 )
-                logger.info("xAI submission complete. Response received.")
-                logger.debug(f"xAI response preview: {completion.choices[0].message.content[:200]}")
-                return completion.choices[0].message.content
-            except Exception as e:
-                logger.error(f"Error calling xAI API: {str(e)}")
-                return f"# xAI API Error\n\n```\n{str(e)}\n```"
-        else:
-            logger.info("[SIMULATION] Would send prompt to xAI here...")
-            # Simulate a response
-            return "# xAI Response (Simulation)\n\nThis is a simulated response because the xAI API client was not available."
-
-    def save_response(self, response: str, output_file: Path, prompt_name: str, submission_time: str):
-        """Save the xAI response to a markdown file."""
+
+    async def _count_tokens(self, prompt: str, model: str) -> int:
+        """Count the prompt tokens locally with tiktoken."""
+        # The first load downloads the encoding, so keep it off the event loop
+        encoding = await asyncio.to_thread(_get_encoding, model)
+        if not encoding:
+            return await super()._count_tokens(prompt, model)
+        # Special-token text in a prompt file is plain text, not a control token
+        return len(await asyncio.to_thread(encoding.encode, prompt, disallowed_special=()))
+
+    async def _truncate_middle(self, prompt: str, model: str, max_tokens: int, tokens: int) -> str:
+        """Keep the first and last tokens of the prompt so it fits in max_tokens."""
+        encoding = await asyncio.to_thread(_get_encoding, model)
+        if not encoding:
+            return await super()._truncate_middle(prompt, model, max_tokens, tokens)
+        ids = await asyncio.to_thread(encoding.encode, prompt, disallowed_special=())
+        keep = max_tokens - len(encoding.encode(TRIM_MARKER))
+        if keep <= 0:
+            raise PromptTooLongError(f"{max_tokens} tokens are too few to keep any of the prompt when trimming")
+        head = keep // 2
+        return encoding.decode(ids[:head]) + TRIM_MARKER + encoding.decode(ids[len(ids) - (keep - head):])
+
+    def _is_retryable(self, error: Exception) -> bool:
+        """Rate limits, connection errors, timeouts and server errors are worth retrying."""
+        openai = _get_openai()
+        # APITimeoutError is a subclass of APIConnectionError
+        return isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+
+    async def _call_api(self, prompt: str, model: str):
+        """Call the xAI API and yield the response text as it arrives, raising on failure."""
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices:
+                yield chunk.choices[0].delta.content or ""
+
+    async def submit_batch(self, prompts: dict[str, str], model: str = None) -> dict[str, str]:
+        """Submit prompts (keyed by prompt name) as one batch job and return the responses by prompt name."""
+        model = model or self.model
+        logger.info(f"Submitting {len(prompts)} prompts to xAI as a batch job. Model: {model}")
+
+        if not self.client:
+            logger.info("[SIMULATION] Would send batch job to xAI here...")
+            return {name: self._simulated_response() for name in prompts}
+
         try:
-            # Add metadata to the top of the file
-            metadata = (
-                f"---\n"
-                f"prompt: {prompt_name}\n"
-                f"submitted_at: {submission_time}\n"
-                f"---\n\n"
+            requests = "\n".join(
+                json.dumps({
+                    "custom_id": name,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {"model": model, "messages": [{"role": "user", "content": prompt}]},
+                })
+                for name, prompt in prompts.items()
+            )
+            batch_file = await self.client.files.create(
+                file=("batch_requests.jsonl", requests.encode("utf-8")),
+                purpose="batch"
+            )
+            batch = await self.client.batches.create(
+                input_file_id=batch_file.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window="24h"
+            )
+            logger.info(f"xAI batch job created: {batch.id}")
+
+            batch = await poll_until(
+                lambda: self.client.batches.retrieve(batch.id),
+                lambda b: b.status in BATCH_DONE_STATUSES
             )
-            
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(metadata + response)
-                
-            logger.info(f"Response saved to {output_file}")
+            if batch.status != "completed" or not batch.output_file_id:
+                raise RuntimeError(f"Batch job {batch.id} finished with status '{batch.status}'")
+            logger.info("xAI batch job complete. Downloading results.")
+
+            output = await self.client.files.content(batch.output_file_id)
         except Exception as e:
-            logger.error(f"Error saving response: {str(e)}")
-
-def find_prompt_file(prompt_name: str = None) -> Path:
-    """Find a prompt file by name or list available prompts if none specified."""
-    prompts_dir = Path(PROMPTS_DIR)
-    
-    if not prompt_name:
-        # List available prompts
-        prompts = list(prompts_dir.glob("*.txt"))
-        if not prompts:
-            logger.error(f"No prompt files found in {prompts_dir}")
-            sys.exit(1)
-        
-        print("Available prompts:")
-        for i, prompt in enumerate(prompts, 1):
-            print(f"{i}. {prompt.stem}")
-        
-        # Ask user to select a prompt
-        selection = input("\nEnter prompt number to use: ")
-        try:
-            selected_idx = int(selection) - 1
-            if 0 <= selected_idx < len(prompts):
-                return prompts[selected_idx]
+            logger.error(f"Error running xAI batch job: {str(e)}")
+            return {name: self._error_response(e) for name in prompts}
+
+        responses = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            # A malformed line only loses its own prompt, reported as missing below
+            try:
+                result = json.loads(line)
+                name = result.get("custom_id")
+                body = (result.get("response") or {}).get("body") or {}
+                choices = body.get("choices") or [{}]
+                content = (choices[0].get("message") or {}).get("content")
+            except Exception as e:
+                logger.error(f"Skipping malformed xAI batch result line: {str(e)}")
+                continue
+            if result.get("error") or not content:
+                responses[name] = self._error_response(result.get("error") or body.get("error") or "No response returned")
             else:
-                logger.error("Invalid selection")
-                sys.exit(1)
-        except ValueError:
-            logger.error("Invalid input")
-            sys.exit(1)
-    else:
-        # Find prompt by name
-        prompt_file = prompts_dir / f"{prompt_name}.txt"
-        if not prompt_file.exists():
-            logger.error(f"Prompt file not found: {prompt_file}")
-            sys.exit(1)
-        return prompt_file
-
-def main():
-    parser = argparse.ArgumentParser(description="xAI Prompt Submitter")
-    parser.add_argument('--prompt', type=str, help="Name of the prompt file to use (without .txt extension)")
-    parser.add_argument('--output', type=Path, help="Path to the output markdown file (optional)")
-    args = parser.parse_args()
-
-    # Find prompt file
-    prompt_file = find_prompt_file(args.prompt)
-    prompt_name = prompt_file.stem
-    
-    # Set up output file
-    submission_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-    reports_dir = Path(REPORTS_DIR)
-    os.makedirs(reports_dir, exist_ok=True)
-    
-    output_file = args.output if args.output else reports_dir / f"xai_{prompt_name}_{submission_time}.md"
-
-    # Initialize submitter and process prompt
-    submitter = XAIPromptSubmitter()
-    prompt = submitter.read_prompt(prompt_file)
-    response = submitter.submit_prompt(prompt)
-    
-    # Save the response
-    formatted_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    submitter.save_response(response, output_file, prompt_name, formatted_time)
+                responses[name] = content
+
+        for name in prompts:
+            if name not in responses:
+                logger.error(f"No batch result returned for prompt: {name}")
+                responses[name] = self._error_response("No result returned by the batch job")
+        return responses
 
 if __name__ == "__main__":
-    main()
+    # Kept as an entry point for existing usage; the command line lives in submit.py
+    from submit import main
+    main(provider="xai")